@@ -1 +1,3 @@
+from cognite.utils.infrastructure._archive_sinks import FsspecSink, LocalSink, S3Sink, Sink
+from cognite.utils.infrastructure._cdf_fleet_archiver import FleetArchiver
 from cognite.utils.infrastructure._cdf_project_archiver import ProjectArchiver
@@ -0,0 +1,342 @@
+import io
+import os
+import posixpath
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Callable, List, Optional
+
+
+class Sink(ABC):
+    """A destination that archived data is streamed into."""
+
+    @abstractmethod
+    def open(self, path: str) -> BinaryIO:
+        """Open a writable binary stream at the given path. Closing the stream finalizes the output;
+        calling `abort()` on it, or leaving its `with` block through an exception, discards the output so that
+        no truncated data is left behind.
+
+        Args:
+            path (str): Path of the output, relative to the root of the sink.
+
+        Returns:
+            (BinaryIO): A writable binary stream.
+        """
+
+    def makedirs(self, path: str) -> None:
+        """Create a directory at the given path, if the sink has such a concept.
+
+        Args:
+            path (str): Path of the directory, relative to the root of the sink.
+        """
+
+
+class _SinkWriter(io.BufferedIOBase):
+    """Base of the streams returned by sinks, which discard their output when a `with` block fails."""
+
+    def writable(self) -> bool:
+        return True
+
+    @abstractmethod
+    def abort(self) -> None:
+        """Close the stream, discarding everything written so far."""
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        # Do not leave a truncated output behind when writing fails midway
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def __del__(self) -> None:
+        # io.IOBase would close, i.e. commit, a stream that is garbage collected unclosed; discard it instead
+        if not self.closed:
+            try:
+                self.abort()
+            except Exception:
+                pass
+
+
+class _RenameOnCloseWriter(_SinkWriter):
+    """A stream writing to a temporary path, which is moved to the final path only once closed successfully.
+
+    Args:
+        fp (BinaryIO): A writable binary stream on the temporary path.
+        commit (Callable[[], None]): A function moving the temporary path to the final path.
+        discard (Callable[[], None]): A function removing the temporary path.
+    """
+
+    def __init__(self, fp: BinaryIO, commit: Callable[[], None], discard: Callable[[], None]) -> None:
+        super().__init__()
+        self._fp = fp
+        self._commit = commit
+        self._discard = discard
+
+    def write(self, b) -> int:
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        return self._fp.write(b)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            self._fp.close()
+            self._commit()
+        except Exception:
+            self._discard()
+            raise
+        finally:
+            super().close()
+
+    def abort(self) -> None:
+        if self.closed:
+            return
+        try:
+            self._fp.close()
+            self._discard()
+        finally:
+            super().close()
+
+
+def _temporary_path(path: str) -> str:
+    return f"{path}.{uuid.uuid4().hex}.tmp"
+
+
+class LocalSink(Sink):
+    """Write archived data to the local filesystem.
+
+    Args:
+        root (str): Directory that output paths are resolved against. Defaults to "." (i.e. current directory).
+    """
+
+    def __init__(self, root: str = ".") -> None:
+        self._root = root
+
+    def open(self, path: str) -> BinaryIO:
+        filepath = os.path.join(self._root, path)
+        self.makedirs(os.path.dirname(path))
+        tmp_filepath = _temporary_path(filepath)
+        return _RenameOnCloseWriter(
+            open(tmp_filepath, "wb"), lambda: os.replace(tmp_filepath, filepath), lambda: os.remove(tmp_filepath)
+        )
+
+    def makedirs(self, path: str) -> None:
+        os.makedirs(os.path.join(self._root, path), exist_ok=True)
+
+
+class FsspecSink(Sink):
+    """Write archived data to any filesystem supported by `fsspec` (e.g. "s3://", "gcs://", "abfs://").
+    Outputs are written to a temporary path and moved into place once complete; on object stores the move
+    is a server-side copy. Requires `fsspec` and the protocol-specific backend to be installed.
+
+    Args:
+        url (str): URL of the directory that output paths are resolved against.
+        block_size (int, optional): Size in bytes of the blocks written to the backend. Defaults to `None`
+            (i.e. the backend's default).
+        **storage_options: Options passed on to the `fsspec` filesystem, e.g. credentials or endpoint.
+    """
+
+    def __init__(self, url: str, block_size: Optional[int] = None, **storage_options) -> None:
+        try:
+            import fsspec
+        except ImportError:
+            raise ImportError("<FsspecSink> requires fsspec; install it with `pip install fsspec`")
+        self._fs, self._root = fsspec.core.url_to_fs(url, **storage_options)
+        self._block_size = block_size
+
+    def _full_path(self, path: str) -> str:
+        return posixpath.normpath(posixpath.join(self._root, path.replace(os.sep, "/")))
+
+    def open(self, path: str) -> BinaryIO:
+        kwargs = {} if self._block_size is None else {"block_size": self._block_size}
+        full_path = self._full_path(path)
+        tmp_path = _temporary_path(full_path)
+        self._fs.makedirs(posixpath.dirname(full_path), exist_ok=True)
+        return _RenameOnCloseWriter(
+            self._fs.open(tmp_path, "wb", **kwargs),
+            lambda: self._fs.mv(tmp_path, full_path),
+            lambda: self._fs.rm(tmp_path),
+        )
+
+    def makedirs(self, path: str) -> None:
+        self._fs.makedirs(self._full_path(path), exist_ok=True)
+
+
+def _upload_part(client, bucket: str, key: str, upload_id: str, part_number: int, data: bytes) -> dict:
+    response = client.upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=data)
+    return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+
+class _MultipartUploadWriter(_SinkWriter):
+    """A writable stream that cuts incoming bytes into size-bounded parts and uploads them to S3
+    concurrently as a multipart upload. Outputs smaller than a single part are uploaded with one
+    `put_object` request instead. At most `max_concurrency` parts are held in memory at once, on top
+    of the part being filled.
+    """
+
+    # S3 allows at most 10,000 parts of at most 5 GiB each per upload
+    _MAX_PARTS = 10000
+    _MAX_PART_SIZE = 5 * 1024 * 1024 * 1024
+    _PARTS_PER_SIZE_STEP = 1000
+
+    def __init__(self, client, bucket: str, key: str, part_size: int, max_concurrency: int) -> None:
+        super().__init__()
+        self._client = client
+        self._bucket = bucket
+        self._key = key
+        self._part_size = part_size
+        self._max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._futures: List[Future] = []
+        self._errors: List[BaseException] = []
+        self._buffer = bytearray()
+        # The multipart upload is only started once the output outgrows a single part
+        self._upload_id = None
+        self._executor = None
+
+    def _next_part_size(self) -> int:
+        # Double the part size every 1,000 parts, so that large outputs stay within the part limit
+        n_steps = len(self._futures) // self._PARTS_PER_SIZE_STEP
+        return min(self._part_size * 2**n_steps, self._MAX_PART_SIZE)
+
+    def write(self, b) -> int:
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        self._buffer += b
+        part_size = self._next_part_size()
+        while len(self._buffer) >= part_size:
+            self._submit_part(part_size)
+            part_size = self._next_part_size()
+        return len(b)
+
+    def _submit_part(self, part_size: int) -> None:
+        """Move the first `part_size` bytes of the buffer into a new part and upload it in the background.
+
+        Args:
+            part_size (int): Number of bytes to upload as the part.
+        """
+        if len(self._futures) >= self._MAX_PARTS:
+            raise Exception(f"Output exceeds the S3 limit of {self._MAX_PARTS} parts per upload")
+        if self._upload_id is None:
+            self._upload_id = self._client.create_multipart_upload(Bucket=self._bucket, Key=self._key)["UploadId"]
+            self._executor = ThreadPoolExecutor(max_workers=self._max_concurrency)
+
+        # Wait for an upload slot before copying the part out, which bounds memory held by pending parts
+        self._slots.acquire()
+        if len(self._errors) > 0:
+            self._slots.release()
+            raise self._errors[0]
+        with memoryview(self._buffer) as view:
+            data = bytes(view[:part_size])
+        del self._buffer[:part_size]
+
+        # Neither the task nor its callback refer back to the writer, so that an unclosed writer is
+        # garbage collected, and thereby aborted, as soon as it is dropped
+        slots, errors = self._slots, self._errors
+
+        def on_part_done(future: Future) -> None:
+            if not future.cancelled() and future.exception() is not None:
+                errors.append(future.exception())
+            slots.release()
+
+        args = (self._client, self._bucket, self._key, self._upload_id, len(self._futures) + 1, data)
+        future = self._executor.submit(_upload_part, *args)
+        future.add_done_callback(on_part_done)
+        self._futures.append(future)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self._upload_id is None:
+                self._client.put_object(Bucket=self._bucket, Key=self._key, Body=bytes(self._buffer))
+            else:
+                if len(self._buffer) > 0:
+                    self._submit_part(len(self._buffer))
+                parts = [future.result() for future in self._futures]
+                self._client.complete_multipart_upload(
+                    Bucket=self._bucket, Key=self._key, UploadId=self._upload_id, MultipartUpload={"Parts": parts}
+                )
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+            self._buffer = bytearray()
+            super().close()
+
+    def abort(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self._upload_id is not None:
+                for future in self._futures:
+                    future.cancel()
+                self._executor.shutdown(wait=True)
+                self._client.abort_multipart_upload(Bucket=self._bucket, Key=self._key, UploadId=self._upload_id)
+        finally:
+            self._buffer = bytearray()
+            super().close()
+
+
+class S3Sink(Sink):
+    """Write archived data to S3 or an S3-compatible object store (e.g. MinIO) using multipart uploads.
+    Data is uploaded in parts of `part_size` bytes while it is still being produced, so no scratch
+    disk is needed; outputs smaller than one part take a single request. Requires `boto3` to be installed.
+
+    S3 allows at most 10,000 parts per upload. To stay within that limit, the part size doubles every
+    1,000 parts (up to the S3 maximum of 5 GiB), which lets the default part size reach the 5 TiB object
+    limit. Memory use grows accordingly: each open output holds up to about `(max_concurrency + 1) * part_size`
+    bytes, i.e. the parts being uploaded plus the part being filled.
+
+    Args:
+        bucket (str): Name of the bucket to write to.
+        prefix (str): Key prefix that output paths are resolved against. Defaults to "" (i.e. bucket root).
+        part_size (int): Size in bytes of each uploaded part, at least 5 MiB. Defaults to 8 MiB.
+        max_concurrency (int): Maximum number of parts uploaded at once per output. Defaults to 4.
+        **client_kwargs: Options passed on to `boto3.client("s3", ...)`, e.g. `endpoint_url` or credentials.
+    """
+
+    _MIN_PART_SIZE = 5 * 1024 * 1024
+
+    def __init__(
+        self, bucket: str, prefix: str = "", part_size: int = 8 * 1024 * 1024, max_concurrency: int = 4, **client_kwargs
+    ) -> None:
+        try:
+            import boto3  # noqa: F401
+        except ImportError:
+            raise ImportError("<S3Sink> requires boto3; install it with `pip install boto3`")
+        if part_size < self._MIN_PART_SIZE:
+            raise ValueError(f"<part_size> should be at least {self._MIN_PART_SIZE} bytes")
+        if max_concurrency < 1:
+            raise ValueError("<max_concurrency> should be positive")
+        self._bucket = bucket
+        self._prefix = prefix
+        self._part_size = part_size
+        self._max_concurrency = max_concurrency
+        self._client_kwargs = client_kwargs
+        self._client = None
+
+    def __getstate__(self) -> dict:
+        # boto3 clients cannot be pickled; workers create their own on first use
+        state = self.__dict__.copy()
+        state["_client"] = None
+        return state
+
+    def _get_client(self):
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client("s3", **self._client_kwargs)
+        return self._client
+
+    def _key(self, path: str) -> str:
+        return posixpath.normpath(posixpath.join(self._prefix, path.replace(os.sep, "/"))).lstrip("/")
+
+    def open(self, path: str) -> BinaryIO:
+        return _MultipartUploadWriter(
+            self._get_client(), self._bucket, self._key(path), self._part_size, self._max_concurrency
+        )
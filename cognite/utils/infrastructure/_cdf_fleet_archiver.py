@@ -0,0 +1,229 @@
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+from cognite.client import CogniteClient
+
+from cognite.utils._logging import logger
+from cognite.utils.infrastructure._archive_sinks import Sink
+from cognite.utils.infrastructure._cdf_project_archiver import ProjectArchiver
+
+ARCHIVABLE_RESOURCE_TYPES = [
+    "assets",
+    "timeseries",
+    "sequences",
+    "events",
+    "file_metadata",
+    "files",
+    "relationships",
+    "labels",
+    "datasets",
+]
+
+
+def _archive_resource(
+    client_factory: Callable[[str], CogniteClient],
+    project: str,
+    resource_type: str,
+    dirpath: str,
+    compress: bool,
+    sink: Optional[Sink],
+) -> dict:
+    """Archive a single resource type from a single CDF project. Runs inside a worker process.
+
+    Args:
+        client_factory (Callable[[str], CogniteClient]): A function creating a client for the given project.
+        project (str): Name of the CDF project of concern.
+        resource_type (str): Resource type to archive, e.g. "assets" or "files".
+        dirpath (str): Directory path to save the data.
+        compress (bool): Whether to compress the saved data.
+        sink (Sink, optional): Destination to stream the data into. `None` means local filesystem.
+
+    Returns:
+        (dict): Outcome of the task, including number of records archived and any error message.
+    """
+    start_time = time.time()
+    n_records, error = 0, None
+    try:
+        archiver = ProjectArchiver(client_factory(project), sink=sink)
+        n_records = getattr(archiver, f"archive_{resource_type}")(dirpath=dirpath, compress=compress)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return {
+        "resource_type": resource_type,
+        "n_records": n_records,
+        "start_time": start_time,
+        "end_time": time.time(),
+        "error": error,
+    }
+
+
+class FleetArchiver:
+    """Archive data from many CDF projects at once by scheduling (project, resource type) tasks
+    across a process pool. A failing task is recorded and does not stop the other tasks. Tasks that were running
+    when a worker process died abruptly are retried one at a time, so only the task that crashes the pool fails.
+
+    Args:
+        projects (List[str]): Names of CDF projects of concern.
+        client_factory (Callable[[str], CogniteClient]): A function creating a client for the given project name.
+            Clients hold credentials that cannot be pickled, so each worker process creates its own through
+            this function. It is sent to worker processes, so it should be picklable (e.g. a module-level function).
+        max_workers (int): Maximum number of tasks running at once across all projects. Defaults to 4.
+        max_workers_per_project (int): Maximum number of tasks running at once for a single project. Defaults to 2.
+        sink (Sink, optional): Destination to stream the data into. Like `client_factory`, it is sent to worker
+            processes. Defaults to `None` (i.e. local filesystem).
+    """
+
+    def __init__(
+        self,
+        projects: List[str],
+        client_factory: Callable[[str], CogniteClient],
+        max_workers: int = 4,
+        max_workers_per_project: int = 2,
+        sink: Optional[Sink] = None,
+    ) -> None:
+        if len(projects) == 0:
+            raise ValueError("<projects> should contain at least one project")
+        if max_workers < 1 or max_workers_per_project < 1:
+            raise ValueError("<max_workers> and <max_workers_per_project> should be positive")
+        self._projects = projects
+        self._client_factory = client_factory
+        self._max_workers = max_workers
+        self._max_workers_per_project = max_workers_per_project
+        self._sink = sink
+        self._task_results = None
+        self._N_ATTEMPTS_PER_TASK = 2
+
+    def archive(self, resource_types: Optional[List[str]] = None, dirpath: str = ".", compress: bool = True) -> None:
+        """Archive the given resource types from all CDF projects.
+
+        Args:
+            resource_types (List[str], optional): Resource types to archive. Each should be one of
+                `ARCHIVABLE_RESOURCE_TYPES`. Defaults to `None` (i.e. all of them).
+            dirpath (str): Directory path to save the data, relative to the sink if one is given.
+                Defaults to "." (i.e. current directory).
+            compress (bool): Whether to compress the saved data. Defaults to `True`.
+        """
+        if resource_types is None:
+            resource_types = ARCHIVABLE_RESOURCE_TYPES
+        for resource_type in resource_types:
+            if resource_type not in ARCHIVABLE_RESOURCE_TYPES:
+                raise ValueError(f"<resource_types> should only contain: {ARCHIVABLE_RESOURCE_TYPES}")
+
+        # Queue tasks by project; projects are identified by position so duplicate names stay apart
+        pending = [deque(resource_types) for _ in self._projects]
+        n_running = [0] * len(self._projects)
+        futures: Dict[Future, Tuple[int, str]] = {}
+        # Tasks that were running when the pool broke, with the number of times they have done so
+        suspects: Dict[Tuple[int, str], int] = {}
+
+        # Results are kept as they arrive, so a partial report survives an interrupted run
+        self._task_results = []
+
+        def submit(i: int, resource_type: str) -> None:
+            nonlocal executor
+            args = (self._client_factory, self._projects[i], resource_type, dirpath, compress, self._sink)
+            try:
+                future = executor.submit(_archive_resource, *args)
+            except BrokenProcessPool:
+                # A worker died abruptly (e.g. out of memory) and took the pool down; carry on with a fresh one
+                logger.warning("Process pool is broken; restarting it")
+                executor.shutdown(wait=False)
+                executor = ProcessPoolExecutor(max_workers=self._max_workers)
+                future = executor.submit(_archive_resource, *args)
+            futures[future] = (i, resource_type)
+            n_running[i] += 1
+
+        def submit_tasks() -> None:
+            # Suspects run on their own, so that a crash is only blamed on the task that caused it
+            if any(task in suspects for task in futures.values()):
+                return
+            for i in range(len(self._projects)):
+                if len(pending[i]) > 0 and (i, pending[i][0]) in suspects:
+                    if len(futures) == 0:
+                        submit(i, pending[i].popleft())
+                    return
+
+            # Hand out one task per project per pass, so that projects progress evenly
+            submitted = True
+            while submitted and len(futures) < self._max_workers:
+                submitted = False
+                for i in range(len(self._projects)):
+                    if len(futures) >= self._max_workers:
+                        break
+                    if len(pending[i]) == 0 or n_running[i] >= self._max_workers_per_project:
+                        continue
+                    submit(i, pending[i].popleft())
+                    submitted = True
+
+        logger.info(f"Archiving {len(self._projects)} projects with {self._max_workers} workers...")
+        executor = ProcessPoolExecutor(max_workers=self._max_workers)
+        try:
+            submit_tasks()
+            while len(futures) > 0:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i, resource_type = futures.pop(future)
+                    n_running[i] -= 1
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        if isinstance(e, BrokenProcessPool):
+                            suspects[(i, resource_type)] = suspects.get((i, resource_type), 0) + 1
+                            if suspects[(i, resource_type)] < self._N_ATTEMPTS_PER_TASK:
+                                logger.warning(f"<{resource_type}> of project <{self._projects[i]}> will be retried")
+                                pending[i].appendleft(resource_type)
+                                continue
+                        now = time.time()
+                        result = {
+                            "resource_type": resource_type,
+                            "n_records": 0,
+                            "start_time": now,
+                            "end_time": now,
+                            "error": f"{type(e).__name__}: {e}",
+                        }
+                    result["project"] = self._projects[i]
+                    result["project_index"] = i
+                    if result["error"] is None:
+                        logger.info(f"<{resource_type}> of project <{result['project']}> archived")
+                    else:
+                        logger.warning(f"<{resource_type}> of project <{result['project']}> failed: {result['error']}")
+                    self._task_results.append(result)
+                submit_tasks()
+        finally:
+            executor.shutdown(wait=True)
+
+        n_failed = sum(result["error"] is not None for result in self._task_results)
+        logger.info(f"{len(self._task_results) - n_failed} tasks succeeded and {n_failed} tasks failed")
+
+    def to_pandas(self) -> pd.DataFrame:
+        """Present the consolidated archiving report in a tabular form.
+
+        Returns:
+            (pandas.DataFrame): A table containing archiving outcome and throughput by project.
+        """
+        if self._task_results is None:
+            raise Exception("No projects have been archived yet; run <archive> method first")
+
+        rows = []
+        for i, project in enumerate(self._projects):
+            results = [result for result in self._task_results if result["project_index"] == i]
+            n_records = sum(result["n_records"] for result in results)
+            elapsed_sec = 0.0
+            if len(results) > 0:
+                elapsed_sec = max(r["end_time"] for r in results) - min(r["start_time"] for r in results)
+            rows.append(
+                {
+                    "project": project,
+                    "n_succeeded": sum(result["error"] is None for result in results),
+                    "n_failed": sum(result["error"] is not None for result in results),
+                    "n_records": n_records,
+                    "elapsed_sec": round(elapsed_sec, 2),
+                    "records_per_sec": round(n_records / elapsed_sec, 2) if elapsed_sec > 0 else None,
+                    "errors": {r["resource_type"]: r["error"] for r in results if r["error"] is not None},
+                }
+            )
+        return pd.DataFrame(rows)
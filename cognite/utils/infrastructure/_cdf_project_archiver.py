@@ -2,11 +2,15 @@ import gzip
 import json
 import os
 import shutil
-from typing import List
+import tempfile
+import zipfile
+from contextlib import ExitStack
+from typing import BinaryIO, Iterator, List, Optional
 
 from cognite.client import CogniteClient
 
 from cognite.utils._logging import logger
+from cognite.utils.infrastructure._archive_sinks import LocalSink, Sink
 
 
 class ProjectArchiver:
@@ -14,10 +18,13 @@ class ProjectArchiver:
 
     Args:
         client (CogniteClient): A client object connecting to CDF project of concern.
+        sink (Sink, optional): Destination to stream the data into. Defaults to `None` (i.e. local filesystem),
+            in which case `dirpath` arguments are ordinary directory paths.
     """
 
-    def __init__(self, client: CogniteClient) -> None:
+    def __init__(self, client: CogniteClient, sink: Optional[Sink] = None) -> None:
         self._client = client
+        self._sink = sink if sink is not None else LocalSink()
         self._standard_resource_types = {
             # (CDF term): (text to display)
             "assets": "assets",
@@ -30,168 +37,261 @@ class ProjectArchiver:
             "data_sets": "datasets",
         }
         self._N_FILES_PER_DOWNLOAD = 100
+        self._N_DOWNLOAD_ATTEMPTS = 3
+        self._N_RESOURCES_PER_CHUNK = 1000
 
-    def _save_json(self, data: List[dict], filepath: str, compress: bool) -> None:
-        """Write serialized data into a file.
+    def _open_output(self, stack: ExitStack, filepath: str, compress: bool) -> BinaryIO:
+        """Open a binary stream on the sink, compressing on the fly if applicable.
 
         Args:
-            data (List[dict]): A array of serialized data.
+            stack (ExitStack): Context stack that takes care of closing the stream.
             filepath (str): File path to save the data.
             compress (bool): Whether to compress the saved data.
+
+        Returns:
+            (BinaryIO): A writable binary stream.
         """
         if compress:
-            json_str = json.dumps(data) + "\n"
-            json_bytes = json_str.encode("utf-8")
-            with gzip.open(filepath + ".gzip", "w") as fp:
-                fp.write(json_bytes)
-        else:
-            with open(filepath, "w", encoding="utf-8") as fp:
-                json.dump(data, fp, ensure_ascii=False, indent=4)
+            fp = stack.enter_context(self._sink.open(filepath + ".gzip"))
+            return stack.enter_context(gzip.GzipFile(fileobj=fp, mode="wb"))
+        return stack.enter_context(self._sink.open(filepath))
+
+    def _save_json(self, chunks: Iterator[List[dict]], filepath: str, compress: bool) -> int:
+        """Write serialized data into a file chunk by chunk, so that fetching and writing overlap.
+        The output is a single JSON array, identical to dumping all data at once.
 
-    def _archive_standard_resources(self, resource_type: str, dirpath: str, compress: bool) -> None:
+        Args:
+            chunks (Iterator[List[dict]]): Chunks of serialized data.
+            filepath (str): File path to save the data.
+            compress (bool): Whether to compress the saved data.
+
+        Returns:
+            (int): Number of records written. No file is created if it is zero.
+        """
+        n_records = 0
+        with ExitStack() as stack:
+            for chunk in chunks:
+                for record in chunk:
+                    if n_records == 0:
+                        fp = self._open_output(stack, filepath, compress)
+                        fp.write(b"[" if compress else b"[\n")
+                    else:
+                        fp.write(b", " if compress else b",\n")
+                    if compress:
+                        fp.write(json.dumps(record).encode("utf-8"))
+                    else:
+                        # Indent on "\n" only: unlike str.splitlines, it never splits inside string values
+                        record_str = json.dumps(record, ensure_ascii=False, indent=4)
+                        fp.write((" " * 4 + record_str.replace("\n", "\n" + " " * 4)).encode("utf-8"))
+                    n_records += 1
+            if n_records > 0:
+                fp.write(b"]\n" if compress else b"\n]")
+        return n_records
+
+    def _archive_standard_resources(self, resource_type: str, dirpath: str, compress: bool) -> int:
         """Archive serializable data from CDF.
 
         Args:
             resource_type (str): CDF resource type to archive. It should be serializable.
             dirpath (str): Directory path to save the data.
             compress (bool): Whether to compress the saved data.
+
+        Returns:
+            (int): Number of records archived.
         """
         if resource_type not in self._standard_resource_types.keys():
             raise ValueError(f"<resource_type> should be one of: {self._standard_resource_types.keys()}")
 
         # Specify file location to save data
-        if not os.path.exists(dirpath):
-            os.makedirs(dirpath)
         filename = f"{self._client.config.project}_{self._standard_resource_types[resource_type]}.json"
         filepath = os.path.join(dirpath, filename)
 
         # Extract and save data
         logger.info(f"Archiving <{resource_type}>...")
         client_method = getattr(self._client, resource_type)
-        resources = client_method.list(limit=None)
-        if len(resources) > 0:
-            data = resources.dump()
-            self._save_json(data, filepath, compress)
-            logger.info(f"{len(resources)} records of type <{resource_type}> have been archived")
+        chunks = (resources.dump() for resources in client_method(chunk_size=self._N_RESOURCES_PER_CHUNK))
+        n_records = self._save_json(chunks, filepath, compress)
+        if n_records > 0:
+            logger.info(f"{n_records} records of type <{resource_type}> have been archived")
         else:
             logger.info(f"No data exists for type <{resource_type}>")
+        return n_records
 
-    def _download_files(self, dirpath: str, compress: bool) -> None:
-        """Archive file data from CDF.
+    def _download_files(self, dirpath: str, compress: bool) -> int:
+        """Archive file data from CDF. Files are downloaded in small batches to a temporary directory
+        and streamed from there into the sink, so scratch disk is bounded by a single batch.
 
         Args:
             dirpath (str): Directory path to save the data.
             compress (bool): Whether to compress the saved data.
+
+        Returns:
+            (int): Number of files downloaded.
         """
         # Specify directory location to save data
         dirname = f"{self._client.config.project}_file_downloads"
         new_dirpath = os.path.join(dirpath, dirname)
-        if not os.path.exists(new_dirpath):
-            os.makedirs(new_dirpath)
 
         # Identify files to download
         files = self._client.files.list(limit=None)
 
-        # Download files in small batches
-        logger.info(f"Downloading {len(files)} files...")
-        n_files_downloaded = 0
-        ids_to_download = [f.id for f in files]
-        while len(ids_to_download) > 0:
-            failed_ids = []
-            for i in range(len(ids_to_download) // self._N_FILES_PER_DOWNLOAD + 1):
-                ids_batch = ids_to_download[i * self._N_FILES_PER_DOWNLOAD : (i + 1) * self._N_FILES_PER_DOWNLOAD]
-                try:
-                    self._client.files.download(new_dirpath, id=ids_batch)
+        with ExitStack() as stack:
+            if compress:
+                fp = stack.enter_context(self._sink.open(new_dirpath + ".zip"))
+                zip_file = stack.enter_context(zipfile.ZipFile(fp, "w", zipfile.ZIP_DEFLATED))
+            else:
+                self._sink.makedirs(new_dirpath)
+
+            # Download files in small batches, retrying failed batches a limited number of times
+            logger.info(f"Downloading {len(files)} files...")
+            n_files_downloaded = 0
+            ids_to_download = [f.id for f in files]
+            for _ in range(self._N_DOWNLOAD_ATTEMPTS):
+                if len(ids_to_download) == 0:
+                    break
+                failed_ids = []
+                for i in range(0, len(ids_to_download), self._N_FILES_PER_DOWNLOAD):
+                    ids_batch = ids_to_download[i : i + self._N_FILES_PER_DOWNLOAD]
+                    with tempfile.TemporaryDirectory() as tmp_dirpath:
+                        try:
+                            self._client.files.download(tmp_dirpath, id=ids_batch)
+                        except Exception:
+                            failed_ids = failed_ids + ids_batch
+                            continue
+                        for filename in sorted(os.listdir(tmp_dirpath)):
+                            tmp_filepath = os.path.join(tmp_dirpath, filename)
+                            if compress:
+                                zip_file.write(tmp_filepath, arcname=filename)
+                            else:
+                                with open(tmp_filepath, "rb") as src, self._sink.open(
+                                    os.path.join(new_dirpath, filename)
+                                ) as dst:
+                                    shutil.copyfileobj(src, dst)
                     n_files_downloaded += len(ids_batch)
                     logger.info(f"{n_files_downloaded} files downloaded")
-                except:
-                    failed_ids = failed_ids + ids_batch
-            ids_to_download = failed_ids
+                ids_to_download = failed_ids
 
-        # Compress data if applicable
-        if compress:
-            logger.info("Compressing files...")
-            shutil.make_archive(new_dirpath, "zip", new_dirpath)
-            shutil.rmtree(new_dirpath)
-            logger.info("Files compressed")
+        # Files downloaded so far are kept, but the archive as a whole is reported as incomplete
+        if len(ids_to_download) > 0:
+            raise Exception(
+                f"{len(ids_to_download)} files could not be downloaded after {self._N_DOWNLOAD_ATTEMPTS} attempts; "
+                f"ids: {ids_to_download}"
+            )
+        return n_files_downloaded
 
-    def archive_assets(self, dirpath: str = ".", compress: bool = True) -> None:
+    def archive_assets(self, dirpath: str = ".", compress: bool = True) -> int:
         """Archive `Asset` resources from CDF.
 
         Args:
-            dirpath (str): Directory path to save the data. Defaults to "." (i.e. current directory).
+            dirpath (str): Directory path to save the data, relative to the sink if one is given.
+                Defaults to "." (i.e. current directory).
             compress (bool): Whether to compress the saved data. Defaults to `True`.
+
+        Returns:
+            (int): Number of records archived.
         """
-        self._archive_standard_resources("assets", dirpath, compress)
+        return self._archive_standard_resources("assets", dirpath, compress)
 
-    def archive_timeseries(self, dirpath: str = ".", compress: bool = True) -> None:
+    def archive_timeseries(self, dirpath: str = ".", compress: bool = True) -> int:
         """Archive `TimeSeries` resources from CDF.
 
         Args:
-            dirpath (str): Directory path to save the data. Defaults to "." (i.e. current directory).
+            dirpath (str): Directory path to save the data, relative to the sink if one is given.
+                Defaults to "." (i.e. current directory).
             compress (bool): Whether to compress the saved data. Defaults to `True`.
+
+        Returns:
+            (int): Number of records archived.
         """
-        self._archive_standard_resources("time_series", dirpath, compress)
+        return self._archive_standard_resources("time_series", dirpath, compress)
 
-    def archive_sequences(self, dirpath: str = ".", compress: bool = True) -> None:
+    def archive_sequences(self, dirpath: str = ".", compress: bool = True) -> int:
         """Archive `Sequence` resources from CDF.
 
         Args:
-            dirpath (str): Directory path to save the data. Defaults to "." (i.e. current directory).
+            dirpath (str): Directory path to save the data, relative to the sink if one is given.
+                Defaults to "." (i.e. current directory).
             compress (bool): Whether to compress the saved data. Defaults to `True`.
+
+        Returns:
+            (int): Number of records archived.
         """
-        self._archive_standard_resources("sequences", dirpath, compress)
+        return self._archive_standard_resources("sequences", dirpath, compress)
 
-    def archive_events(self, dirpath: str = ".", compress: bool = True) -> None:
+    def archive_events(self, dirpath: str = ".", compress: bool = True) -> int:
         """Archive `Event` resources from CDF.
 
         Args:
-            dirpath (str): Directory path to save the data. Defaults to "." (i.e. current directory).
+            dirpath (str): Directory path to save the data, relative to the sink if one is given.
+                Defaults to "." (i.e. current directory).
             compress (bool): Whether to compress the saved data. Defaults to `True`.
+
+        Returns:
+            (int): Number of records archived.
         """
-        self._archive_standard_resources("events", dirpath, compress)
+        return self._archive_standard_resources("events", dirpath, compress)
 
-    def archive_file_metadata(self, dirpath: str = ".", compress: bool = True) -> None:
+    def archive_file_metadata(self, dirpath: str = ".", compress: bool = True) -> int:
         """Archive `FileMetadata` resources from CDF.
 
         Args:
-            dirpath (str): Directory path to save the data. Defaults to "." (i.e. current directory).
+            dirpath (str): Directory path to save the data, relative to the sink if one is given.
+                Defaults to "." (i.e. current directory).
             compress (bool): Whether to compress the saved data. Defaults to `True`.
+
+        Returns:
+            (int): Number of records archived.
         """
-        self._archive_standard_resources("files", dirpath, compress)
+        return self._archive_standard_resources("files", dirpath, compress)
 
-    def archive_files(self, dirpath: str = ".", compress: bool = True) -> None:
+    def archive_files(self, dirpath: str = ".", compress: bool = True) -> int:
         """Archive file data from CDF.
 
         Args:
-            dirpath (str): Directory path to save the data. Defaults to "." (i.e. current directory).
+            dirpath (str): Directory path to save the data, relative to the sink if one is given.
+                Defaults to "." (i.e. current directory).
             compress (bool): Whether to compress the saved data. Defaults to `True`.
+
+        Returns:
+            (int): Number of files downloaded.
         """
-        self._download_files(dirpath, compress)
+        return self._download_files(dirpath, compress)
 
-    def archive_relationships(self, dirpath: str = ".", compress: bool = True) -> None:
+    def archive_relationships(self, dirpath: str = ".", compress: bool = True) -> int:
         """Archive `Relationship` resources from CDF.
 
         Args:
-            dirpath (str): Directory path to save the data. Defaults to "." (i.e. current directory).
+            dirpath (str): Directory path to save the data, relative to the sink if one is given.
+                Defaults to "." (i.e. current directory).
             compress (bool): Whether to compress the saved data. Defaults to `True`.
+
+        Returns:
+            (int): Number of records archived.
         """
-        self._archive_standard_resources("relationships", dirpath, compress)
+        return self._archive_standard_resources("relationships", dirpath, compress)
 
-    def archive_labels(self, dirpath: str = ".", compress: bool = True) -> None:
+    def archive_labels(self, dirpath: str = ".", compress: bool = True) -> int:
         """Archive `Label` resources from CDF.
 
         Args:
-            dirpath (str): Directory path to save the data. Defaults to "." (i.e. current directory).
+            dirpath (str): Directory path to save the data, relative to the sink if one is given.
+                Defaults to "." (i.e. current directory).
             compress (bool): Whether to compress the saved data. Defaults to `True`.
+
+        Returns:
+            (int): Number of records archived.
         """
-        self._archive_standard_resources("labels", dirpath, compress)
+        return self._archive_standard_resources("labels", dirpath, compress)
 
-    def archive_datasets(self, dirpath: str = ".", compress: bool = True) -> None:
+    def archive_datasets(self, dirpath: str = ".", compress: bool = True) -> int:
         """Archive `DataSet` resources from CDF.
 
         Args:
-            dirpath (str): Directory path to save the data. Defaults to "." (i.e. current directory).
+            dirpath (str): Directory path to save the data, relative to the sink if one is given.
+                Defaults to "." (i.e. current directory).
             compress (bool): Whether to compress the saved data. Defaults to `True`.
+
+        Returns:
+            (int): Number of records archived.
         """
-        self._archive_standard_resources("data_sets", dirpath, compress)
+        return self._archive_standard_resources("data_sets", dirpath, compress)
@@ -0,0 +1,213 @@
+import gc
+import gzip
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+from cognite.client import CogniteClient
+from cognite.client.data_classes import Asset, AssetList
+from cognite.client.testing import monkeypatch_cognite_client
+
+from cognite.utils.infrastructure import FsspecSink, LocalSink, ProjectArchiver, S3Sink
+from cognite.utils.infrastructure._archive_sinks import _MultipartUploadWriter
+
+BUCKET = "some-bucket"
+
+
+@pytest.fixture(scope="module")
+def mock_cognite_client():
+    with monkeypatch_cognite_client() as client_mock:
+        assets = AssetList([Asset(external_id=f"RESOURCE-{i}") for i in range(3)])
+        client_mock.assets.side_effect = lambda **kwargs: iter([assets[:2], assets[2:]])
+        client_mock.config.project = "some-project"
+        yield client_mock
+
+
+@pytest.fixture
+def s3_client(monkeypatch):
+    boto3 = pytest.importorskip("boto3")
+    moto = pytest.importorskip("moto")
+    # Recent botocore sends checksummed chunked bodies by default, which moto 4 does not decode
+    monkeypatch.setenv("AWS_REQUEST_CHECKSUM_CALCULATION", "when_required")
+    monkeypatch.setenv("AWS_RESPONSE_CHECKSUM_VALIDATION", "when_required")
+    with moto.mock_s3():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+class StubMultipartClient:
+    def __init__(self, fail_parts=False):
+        self.fail_parts = fail_parts
+        self.put_objects = []
+        self.part_sizes = []
+        self.started = False
+        self.completed = False
+        self.aborted = False
+
+    def put_object(self, Body, **kwargs):
+        self.put_objects.append(Body)
+
+    def create_multipart_upload(self, **kwargs):
+        self.started = True
+        return {"UploadId": "some-upload"}
+
+    def upload_part(self, PartNumber, Body, **kwargs):
+        if self.fail_parts:
+            raise RuntimeError("boom")
+        self.part_sizes.append(len(Body))
+        return {"ETag": str(PartNumber)}
+
+    def complete_multipart_upload(self, **kwargs):
+        self.completed = True
+
+    def abort_multipart_upload(self, **kwargs):
+        self.aborted = True
+
+
+def failing_chunks(**kwargs):
+    yield AssetList([Asset(external_id="RESOURCE-0")])
+    raise RuntimeError("boom")
+
+
+class TestLocalSink:
+    def test_open(self, tmpdir):
+        sink = LocalSink(str(tmpdir))
+        with sink.open(os.path.join("some-dir", "some-file")) as fp:
+            fp.write(b"some-data")
+        assert os.listdir(os.path.join(str(tmpdir), "some-dir")) == ["some-file"]
+        with open(os.path.join(str(tmpdir), "some-dir", "some-file"), "rb") as fp:
+            assert fp.read() == b"some-data"
+
+    def test_abort_on_error(self, tmpdir):
+        sink = LocalSink(str(tmpdir))
+        with pytest.raises(RuntimeError):
+            with sink.open("some-file") as fp:
+                fp.write(b"some-data")
+                raise RuntimeError("boom")
+        assert os.listdir(str(tmpdir)) == []
+
+    def test_abort_on_garbage_collection(self, tmpdir):
+        fp = LocalSink(str(tmpdir)).open("some-file")
+        fp.write(b'[{"partial')
+        del fp
+        gc.collect()
+        assert os.listdir(str(tmpdir)) == []
+
+    @pytest.mark.parametrize("compress", [False, True])
+    def test_project_archiver_with_failing_fetch(self, tmpdir, compress):
+        client = SimpleNamespace(config=SimpleNamespace(project="some-project"), assets=failing_chunks)
+        archiver = ProjectArchiver(client, sink=LocalSink(str(tmpdir)))
+        with pytest.raises(RuntimeError):
+            archiver.archive_assets(compress=compress)
+        assert os.listdir(str(tmpdir)) == []
+
+
+class TestFsspecSink:
+    def test_open(self):
+        pytest.importorskip("fsspec")
+        sink = FsspecSink("memory://some-root")
+        with sink.open("some-file") as fp:
+            fp.write(b"some-data")
+        assert sink._fs.cat(sink._full_path("some-file")) == b"some-data"
+
+    def test_abort_on_error(self):
+        pytest.importorskip("fsspec")
+        sink = FsspecSink("memory://other-root")
+        with pytest.raises(RuntimeError):
+            with sink.open("some-file") as fp:
+                fp.write(b"some-data")
+                raise RuntimeError("boom")
+        assert sink._fs.find(sink._full_path("")) == []
+
+    def test_project_archiver_with_new_directory(self, tmpdir):
+        pytest.importorskip("fsspec")
+        chunks = [AssetList([Asset(external_id="RESOURCE-0")])]
+        client = SimpleNamespace(config=SimpleNamespace(project="some-project"), assets=lambda **kwargs: iter(chunks))
+        archiver = ProjectArchiver(client, sink=FsspecSink(f"file://{tmpdir}"))
+        assert archiver.archive_assets(dirpath=os.path.join("some-dir", "sub-dir"), compress=False) == 1
+        assert os.listdir(os.path.join(str(tmpdir), "some-dir", "sub-dir")) == ["some-project_assets.json"]
+
+
+class TestS3Sink:
+    def test_multipart_upload(self, s3_client, monkeypatch):
+        sink = S3Sink(BUCKET, prefix="some-prefix", part_size=5 * 1024 * 1024, region_name="us-east-1")
+        client = sink._get_client()
+        part_sizes = []
+
+        def upload_part(upload_part=client.upload_part, **kwargs):
+            part_sizes.append(len(kwargs["Body"]))
+            return upload_part(**kwargs)
+
+        monkeypatch.setattr(client, "upload_part", upload_part)
+        data = os.urandom(11 * 1024 * 1024)
+        with sink.open("some-file") as fp:
+            for i in range(0, len(data), 1024 * 1024):
+                fp.write(data[i : i + 1024 * 1024])
+        assert sorted(part_sizes) == [1024 * 1024, 5 * 1024 * 1024, 5 * 1024 * 1024]
+        assert s3_client.get_object(Bucket=BUCKET, Key="some-prefix/some-file")["Body"].read() == data
+
+    def test_abort_on_error(self, s3_client):
+        sink = S3Sink(BUCKET, region_name="us-east-1")
+        with pytest.raises(RuntimeError):
+            with sink.open("some-file") as fp:
+                fp.write(b"some-data")
+                raise RuntimeError("boom")
+        assert "Contents" not in s3_client.list_objects_v2(Bucket=BUCKET)
+        assert "Uploads" not in s3_client.list_multipart_uploads(Bucket=BUCKET)
+
+    def test_part_size_too_small(self):
+        pytest.importorskip("boto3")
+        with pytest.raises(ValueError):
+            S3Sink(BUCKET, part_size=1024)
+
+    def test_part_size_growth(self, monkeypatch):
+        monkeypatch.setattr(_MultipartUploadWriter, "_PARTS_PER_SIZE_STEP", 2)
+        monkeypatch.setattr(_MultipartUploadWriter, "_MAX_PARTS", 5)
+        client = StubMultipartClient()
+        with _MultipartUploadWriter(client, BUCKET, "some-file", part_size=4, max_concurrency=2) as fp:
+            fp.write(b"x" * 40)
+        assert sorted(client.part_sizes) == [4, 4, 8, 8, 16]
+
+        client = StubMultipartClient()
+        with pytest.raises(Exception, match="limit of 5 parts"):
+            with _MultipartUploadWriter(client, BUCKET, "some-file", part_size=4, max_concurrency=2) as fp:
+                fp.write(b"x" * 41)
+        assert client.aborted
+
+    def test_small_output(self):
+        client = StubMultipartClient()
+        with _MultipartUploadWriter(client, BUCKET, "some-file", part_size=4, max_concurrency=2) as fp:
+            fp.write(b"xyz")
+        assert client.put_objects == [b"xyz"]
+        assert not client.started
+
+    def test_failed_part(self):
+        client = StubMultipartClient(fail_parts=True)
+        with pytest.raises(RuntimeError, match="boom"):
+            with _MultipartUploadWriter(client, BUCKET, "some-file", part_size=4, max_concurrency=1) as fp:
+                for _ in range(10):
+                    fp.write(b"x" * 4)
+        assert client.aborted
+        assert not client.completed
+
+    def test_abort_on_garbage_collection(self):
+        client = StubMultipartClient()
+        fp = _MultipartUploadWriter(client, BUCKET, "some-file", part_size=4, max_concurrency=2)
+        fp.write(b"x" * 10)
+        del fp
+        gc.collect()
+        assert client.aborted
+        assert not client.completed
+        assert client.put_objects == []
+
+    def test_project_archiver(self, mock_cognite_client, s3_client):
+        archiver = ProjectArchiver(CogniteClient(), sink=S3Sink(BUCKET, prefix="archive", region_name="us-east-1"))
+        assert archiver.archive_assets(compress=False) == 3
+        assert archiver.archive_assets(compress=True) == 3
+
+        body = s3_client.get_object(Bucket=BUCKET, Key="archive/some-project_assets.json")["Body"].read()
+        assert [r["external_id"] for r in json.loads(body)] == ["RESOURCE-0", "RESOURCE-1", "RESOURCE-2"]
+        body = s3_client.get_object(Bucket=BUCKET, Key="archive/some-project_assets.json.gzip")["Body"].read()
+        assert len(json.loads(gzip.decompress(body))) == 3
@@ -0,0 +1,69 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from cognite.utils.infrastructure import FleetArchiver
+
+
+class StubResourceList(list):
+    def dump(self):
+        return list(self)
+
+
+class StubResourceAPI:
+    def __call__(self, chunk_size):
+        return iter([StubResourceList([{"external_id": "RESOURCE-1"}, {"external_id": "RESOURCE-2"}])])
+
+
+def make_stub_client(project):
+    # Runs inside worker processes, so it has to be a picklable module-level function
+    if project == "crashing-project":
+        os._exit(1)
+    if project == "failing-project":
+        raise RuntimeError("boom")
+    return SimpleNamespace(config=SimpleNamespace(project=project), assets=StubResourceAPI(), labels=StubResourceAPI())
+
+
+class TestFleetArchiver:
+    def test_archive(self, tmpdir):
+        tmpdir_path = str(tmpdir)
+        archiver = FleetArchiver(["project-1", "project-2"], make_stub_client, max_workers=2, max_workers_per_project=1)
+        archiver.archive(resource_types=["assets", "labels"], dirpath=tmpdir_path, compress=False)
+        for project in ["project-1", "project-2"]:
+            assert f"{project}_assets.json" in os.listdir(tmpdir_path)
+            assert f"{project}_labels.json" in os.listdir(tmpdir_path)
+
+        report = archiver.to_pandas()
+        assert report["project"].tolist() == ["project-1", "project-2"]
+        assert report["n_succeeded"].tolist() == [2, 2]
+        assert report["n_failed"].tolist() == [0, 0]
+        assert report["n_records"].tolist() == [4, 4]
+
+    def test_archive_with_failures(self, tmpdir):
+        archiver = FleetArchiver(["project-1", "failing-project"], make_stub_client)
+        archiver.archive(resource_types=["assets", "labels"], dirpath=str(tmpdir), compress=True)
+
+        report = archiver.to_pandas()
+        assert report["n_succeeded"].tolist() == [2, 0]
+        assert report["n_failed"].tolist() == [0, 2]
+        assert report.loc[1, "errors"] == {"assets": "RuntimeError: boom", "labels": "RuntimeError: boom"}
+
+    def test_archive_with_crashing_worker(self, tmpdir):
+        archiver = FleetArchiver(["project-1", "crashing-project", "project-2"], make_stub_client, max_workers=3)
+        archiver.archive(resource_types=["assets", "labels"], dirpath=str(tmpdir), compress=True)
+
+        report = archiver.to_pandas()
+        assert report["n_succeeded"].tolist() == [2, 0, 2]
+        assert report["n_failed"].tolist() == [0, 2, 0]
+        assert all(error.startswith("BrokenProcessPool") for error in report.loc[1, "errors"].values())
+
+    def test_invalid_resource_type(self):
+        archiver = FleetArchiver(["project-1"], make_stub_client)
+        with pytest.raises(ValueError):
+            archiver.archive(resource_types=["not_a_resource"])
+
+    def test_report_before_archive(self):
+        archiver = FleetArchiver(["project-1"], make_stub_client)
+        with pytest.raises(Exception):
+            archiver.to_pandas()
@@ -1,4 +1,6 @@
+import json
 import os
+from types import SimpleNamespace
 
 import pytest
 from cognite.client import CogniteClient
@@ -38,16 +40,21 @@ def mock_cognite_client():
             {"id": 2},
             {"id": 3},
         ]
-        client_mock.assets.list.return_value = AssetList([Asset(**r) for r in resources_with_extid])
-        client_mock.time_series.list.return_value = TimeSeriesList([TimeSeries(**r) for r in resources_with_extid])
-        client_mock.sequences.list.return_value = SequenceList([Sequence(**r) for r in resources_with_extid])
-        client_mock.events.list.return_value = EventList([Event(**r) for r in resources_with_extid])
-        client_mock.files.list.return_value = FileMetadataList([FileMetadata(**r) for r in resources_with_id])
-        client_mock.relationships.list.return_value = RelationshipList(
-            [Relationship(**r) for r in resources_with_extid]
-        )
-        client_mock.labels.list.return_value = LabelDefinitionList([LabelDefinition(**r) for r in resources_with_extid])
-        client_mock.data_sets.list.return_value = DataSetList([DataSet(**r) for r in resources_with_extid])
+        resource_lists = {
+            "assets": AssetList([Asset(**r) for r in resources_with_extid]),
+            "time_series": TimeSeriesList([TimeSeries(**r) for r in resources_with_extid]),
+            "sequences": SequenceList([Sequence(**r) for r in resources_with_extid]),
+            "events": EventList([Event(**r) for r in resources_with_extid]),
+            "files": FileMetadataList([FileMetadata(**r) for r in resources_with_id]),
+            "relationships": RelationshipList([Relationship(**r) for r in resources_with_extid]),
+            "labels": LabelDefinitionList([LabelDefinition(**r) for r in resources_with_extid]),
+            "data_sets": DataSetList([DataSet(**r) for r in resources_with_extid]),
+        }
+        for resource_type, resources in resource_lists.items():
+            api_mock = getattr(client_mock, resource_type)
+            api_mock.list.return_value = resources
+            # Resources are fetched in chunks by iterating over the API
+            api_mock.side_effect = lambda resources=resources, **kwargs: iter([resources])
 
         client_mock.config.project = "some-project"
 
@@ -135,3 +142,26 @@ class TestProjectArchiver:
         assert "some-project_file_downloads" in os.listdir(tmpdir_path)
         archiver.archive_files(dirpath=tmpdir_path, compress=True)
         assert "some-project_file_downloads.zip" in os.listdir(tmpdir_path)
+
+    def test_archive_files_with_failing_downloads(self, mock_cognite_client, monkeypatch, tmpdir):
+        monkeypatch.setattr(mock_cognite_client.files.download, "side_effect", Exception("boom"))
+        client = CogniteClient()
+        archiver = ProjectArchiver(client)
+        with pytest.raises(Exception, match="3 files could not be downloaded"):
+            archiver.archive_files(dirpath=str(tmpdir), compress=False)
+
+    def test_archive_matches_single_dump(self, tmpdir):
+        records = [
+            {"external_id": "RESOURCE-1", "description": "line1\u2028line2\u2029para and nel\x85end"},
+            {"external_id": "RESOURCE-2", "metadata": {"key": ["value", {"nested": "\u00e9\n"}]}},
+            {},
+        ]
+        chunks = [AssetList([Asset(**r) for r in records[:1]]), AssetList([Asset(**r) for r in records[1:]])]
+        client = SimpleNamespace(config=SimpleNamespace(project="some-project"), assets=lambda **kwargs: iter(chunks))
+        archiver = ProjectArchiver(client)
+        archiver.archive_assets(dirpath=str(tmpdir), compress=False)
+
+        with open(os.path.join(str(tmpdir), "some-project_assets.json"), "rb") as fp:
+            archived = fp.read()
+        expected = json.dumps([r for chunk in chunks for r in chunk.dump()], ensure_ascii=False, indent=4)
+        assert archived == expected.encode("utf-8")